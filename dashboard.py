@@ -1,121 +1,237 @@
 import sqlite3
+import threading
+import os
+import tempfile
 import pandas as pd
-import json
+import orjson
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
+from flask_caching import Cache
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
 from geopy.geocoders import Nominatim
-import time
+from geopy.extra.rate_limiter import RateLimiter
+from concurrent.futures import ThreadPoolExecutor
 
 # --------------------------
 # LOAD DATA
 # --------------------------
 db_path = "articles.db"
-conn = sqlite3.connect(db_path)
-df = pd.read_sql_query("SELECT * FROM articles", conn)
-conn.close()
+# dominant_category is stored by main.py, so category_scores and locations
+# stay raw JSON strings here (they're only shown in hover tooltips)
+ARTICLE_COLUMNS = "pub_date, title, dominant_category, overall_risk_score, summary, category_scores, locations"
 
-# Safe conversion of JSON strings
-def safe_load_json(x):
-    if pd.isnull(x):
+# One connection shared by the layout, callbacks and geocoding thread (the dev
+# server starts a new thread per request); the lock serializes its use
+_conn = sqlite3.connect(db_path, check_same_thread=False)
+_conn_lock = threading.Lock()
+
+def query_db(sql, params=()):
+    with _conn_lock:
+        return _conn.execute(sql, params).fetchall()
+
+def read_articles(sql, params=()):
+    """Arrow-backed read, so long text fields stay out of Python objects.
+    Columns holding NULLs fall back to float NaN / object None, since
+    Plotly and Dash can't serialize pd.NA."""
+    with _conn_lock:
+        frame = pd.read_sql_query(sql, _conn, params=params, dtype_backend='pyarrow')
+    for col in frame.columns[frame.isna().any()]:
+        if pd.api.types.is_numeric_dtype(frame[col]):
+            frame[col] = frame[col].astype('float64')
+        else:
+            frame[col] = frame[col].astype(object).where(frame[col].notna(), None)
+    return frame
+
+# --------------------------
+# GEOCODING LOCATIONS
+# --------------------------
+GEOCODE_CACHE_PATH = "geocode_cache.json"
+geolocator = Nominatim(user_agent="osint_news_dashboard")
+# Nominatim allows 1 request/second; the limiter is shared by all worker threads
+geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
+
+def load_geocode_cache(path):
+    # A missing or half-written cache (shared with main.py) just starts empty
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
         return {}
+
+def save_geocode_cache(cache, path):
+    """Write to a temp file and swap it in, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
     try:
-        return json.loads(x)
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(cache))
+        os.replace(tmp_path, path)
     except:
-        return {}
+        os.remove(tmp_path)
+        raise
 
-df['category_scores'] = df['category_scores'].apply(safe_load_json)
-df['locations'] = df['locations'].apply(lambda x: json.loads(x) if pd.notnull(x) else [])
-df['pub_date'] = pd.to_datetime(df['pub_date'], errors='coerce')
+# Persistent cache, shared with main.py
+geocode_cache = load_geocode_cache(GEOCODE_CACHE_PATH)
 
-# Compute dominant_category safely
-def get_dominant_category_safe(cat_scores):
-    if not cat_scores or cat_scores == {}:
-        return 'Unknown'
+def geocode_location(loc):
     try:
-        return max(cat_scores, key=cat_scores.get)
+        geo = geocode(loc, timeout=10)
+        if geo:
+            return geo.latitude, geo.longitude
     except:
-        return 'Unknown'
+        pass
+    return None, None
+
+# One row per (article, location), exploded by SQLite; malformed locations
+# JSON is skipped rather than failing the whole query
+LOCATIONS_JOIN = "articles, json_each(CASE WHEN json_valid(articles.locations) THEN articles.locations END) AS j"
 
-df['dominant_category'] = df['category_scores'].apply(get_dominant_category_safe)
+# (lat_map, lon_map) once _refresh_geo has run; the map shows a stub until then
+coord_maps = None
+# Highest article id whose locations have been scanned. main.py's INSERT OR
+# REPLACE gives replaced rows a new id, so they are rescanned too
+geo_scanned_id = 0
+# Held while a geocoding pass runs, so at most one is in flight
+_geo_lock = threading.Lock()
+
+def latest_article_id():
+    return query_db("SELECT MAX(id) FROM articles")[0][0] or 0
+
+def _refresh_geo(max_id):
+    global coord_maps, geo_scanned_id
+    updated = coord_maps is None
+    try:
+        # Only locations of articles added since the last pass, and only if not cached yet
+        unique_locs = [row[0] for row in query_db(
+            f"SELECT DISTINCT j.value FROM {LOCATIONS_JOIN} WHERE articles.id > ? AND articles.id <= ?",
+            (geo_scanned_id, max_id)
+        )]
+        missing = [loc for loc in unique_locs if loc not in geocode_cache]
+        if missing:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                for loc, coords in zip(missing, executor.map(geocode_location, missing)):
+                    geocode_cache[loc] = coords
+            updated = True
+            save_geocode_cache(geocode_cache, GEOCODE_CACHE_PATH)
+        geo_scanned_id = max_id
+    except Exception as e:
+        print(f"Geocoding locations failed: {e}")
+    finally:
+        # Publish lookups from whatever the cache holds, so the map never stays a stub
+        if updated:
+            coord_maps = (
+                pd.Series({loc: coords[0] for loc, coords in geocode_cache.items()}, dtype=float),
+                pd.Series({loc: coords[1] for loc, coords in geocode_cache.items()}, dtype=float)
+            )
+        _geo_lock.release()
+
+def start_geocoding():
+    """Geocode locations of newly ingested articles in a background thread, so
+    imports (gunicorn workers, reloads) and callbacks don't block on Nominatim.
+    Does nothing if there are no new articles or a pass is already running."""
+    max_id = latest_article_id()
+    if coord_maps is not None and max_id <= geo_scanned_id:
+        return
+    if _geo_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_geo, args=(max_id,), daemon=True).start()
+
+start_geocoding()
 
 # --------------------------
-# GEOCODING LOCATIONS
+# FILTERED QUERIES
 # --------------------------
-geolocator = Nominatim(user_agent="osint_news_dashboard")
-geocode_cache = {}
+# The WHERE clause drops filtered-out articles before their locations are exploded
+MAP_COLUMNS = "title, dominant_category, overall_risk_score, summary, category_scores, j.value AS locations"
 
-# Explode locations for mapping
-map_df = df.explode('locations').dropna(subset=['locations'])
+def filter_clause(selected_categories, min_risk):
+    """WHERE clause and params shared by the timeline and map queries (uses idx_cat_risk)."""
+    sql = " WHERE overall_risk_score >= ?"
+    params = [min_risk]
+    if selected_categories:
+        sql += f" AND dominant_category IN ({','.join('?' * len(selected_categories))})"
+        params.extend(selected_categories)
+    return sql, params
+
+def query_map_articles(selected_categories, min_risk):
+    where, params = filter_clause(selected_categories, min_risk)
+    sql = f"SELECT {MAP_COLUMNS} FROM {LOCATIONS_JOIN}" + where
+    frame = read_articles(sql, params)
+    lat_map, lon_map = coord_maps
+    frame = frame.assign(
+        lat=lambda d: d['locations'].map(lat_map),
+        lon=lambda d: d['locations'].map(lon_map)
+    )
+    return frame.dropna(subset=['lat', 'lon'])
 
-latitudes = []
-longitudes = []
+def load_articles(columns=ARTICLE_COLUMNS, where="", params=()):
+    frame = read_articles(f"SELECT {columns} FROM articles" + where, params)
+    # main.py stores pub_date as ISO-8601, which pandas parses on its fast path
+    frame['pub_date'] = pd.to_datetime(frame['pub_date'], format='ISO8601', utc=True, errors='coerce')
+    return frame
 
-for loc in map_df['locations']:
-    if loc in geocode_cache:
-        lat, lon = geocode_cache[loc]
-    else:
-        try:
-            geo = geolocator.geocode(loc, timeout=10)
-            if geo:
-                lat, lon = geo.latitude, geo.longitude
-            else:
-                lat, lon = None, None
-        except:
-            lat, lon = None, None
-        geocode_cache[loc] = (lat, lon)
-        time.sleep(1)
-    latitudes.append(lat)
-    longitudes.append(lon)
-
-map_df['lat'] = latitudes
-map_df['lon'] = longitudes
-map_df = map_df.dropna(subset=['lat', 'lon'])
+def query_articles(selected_categories, min_risk):
+    """Filter in SQLite instead of copying a full frame in pandas."""
+    return load_articles(ARTICLE_COLUMNS, *filter_clause(selected_categories, min_risk))
 
 # --------------------------
 # DASH APP
 # --------------------------
+# Dash encodes callback figures through plotly.io.json, so this covers every response
+pio.json.config.default_engine = 'orjson'
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# Figures only depend on the filter values, so cache them per (categories, min_risk)
+cache = Cache(app.server, config={'CACHE_TYPE': 'SimpleCache'})
 
-# Layout
-app.layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            html.H2("Filters"),
-            html.Label("Select Categories:"),
-            dcc.Dropdown(
-                id='category-dropdown',
-                options=[{'label': cat, 'value': cat} for cat in df['dominant_category'].unique() if cat != 'Unknown'],
-                multi=True,
-                placeholder="Filter by category"
-            ),
-            html.Label("Minimum Risk Score:"),
-            dcc.Slider(
-                id='risk-slider',
-                min=0,
-                max=1,
-                step=0.05,
-                value=0,
-                marks={0: '0', 0.25: '0.25', 0.5: '0.5', 0.75: '0.75', 1: '1'}
-            )
-        ], width=3),
-        dbc.Col([
-            dcc.Tabs([
-                dcc.Tab(label='Timeline', children=[
-                    dcc.Graph(id='timeline-graph')
-                ]),
-                dcc.Tab(label='Global Threat Map', children=[
-                    dcc.Graph(id='map-graph')
-                ]),
-                dcc.Tab(label='News Feed', children=[
-                    dbc.Table.from_dataframe(df[['pub_date','title','dominant_category','overall_risk_score']], striped=True, bordered=True, hover=True, responsive=True)
+TABLE_COLUMNS = "pub_date, title, dominant_category, overall_risk_score"
+
+# Layout, rebuilt on every page load so the category list and news feed
+# include articles ingested since the dashboard started
+def serve_layout():
+    table_df = load_articles(TABLE_COLUMNS)
+    categories = [row[0] for row in query_db(
+        "SELECT DISTINCT dominant_category FROM articles WHERE dominant_category != 'Unknown'"
+    )]
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([
+                html.H2("Filters"),
+                html.Label("Select Categories:"),
+                dcc.Dropdown(
+                    id='category-dropdown',
+                    options=[{'label': cat, 'value': cat} for cat in categories],
+                    multi=True,
+                    placeholder="Filter by category"
+                ),
+                html.Label("Minimum Risk Score:"),
+                dcc.Slider(
+                    id='risk-slider',
+                    min=0,
+                    max=1,
+                    step=0.05,
+                    value=0,
+                    marks={0: '0', 0.25: '0.25', 0.5: '0.5', 0.75: '0.75', 1: '1'}
+                )
+            ], width=3),
+            dbc.Col([
+                dcc.Tabs([
+                    dcc.Tab(label='Timeline', children=[
+                        dcc.Graph(id='timeline-graph')
+                    ]),
+                    dcc.Tab(label='Global Threat Map', children=[
+                        dcc.Graph(id='map-graph')
+                    ]),
+                    dcc.Tab(label='News Feed', children=[
+                        dbc.Table.from_dataframe(table_df, striped=True, bordered=True, hover=True, responsive=True)
+                    ])
                 ])
-            ])
-        ], width=9)
-    ])
-], fluid=True)
+            ], width=9)
+        ])
+    ], fluid=True)
+
+app.layout = serve_layout
 
 # --------------------------
 # CALLBACKS
@@ -127,18 +243,19 @@ app.layout = dbc.Container([
      Input('risk-slider', 'value')]
 )
 def update_graphs(selected_categories, min_risk):
-    filtered_df = df[df['overall_risk_score'] >= min_risk]
-    filtered_map_df = map_df[map_df['overall_risk_score'] >= min_risk]
+    # Sorted tuple so the same selection in any order hits the same cache entry;
+    # geo_ready is part of the key so the stub map isn't served after geocoding
+    return build_figures(tuple(sorted(selected_categories or [])), min_risk, coord_maps is not None)
 
-    if selected_categories:
-        filtered_df = filtered_df[filtered_df['dominant_category'].isin(selected_categories)]
-        filtered_map_df = filtered_map_df[filtered_map_df['dominant_category'].isin(selected_categories)]
+@cache.memoize(timeout=300)
+def build_figures(selected_categories, min_risk, geo_ready):
+    # Pick up locations from newly ingested articles; one MAX(id) lookup per cache miss
+    start_geocoding()
+    filtered_df = query_articles(selected_categories, min_risk)
 
     # Timeline
-    timeline_df = filtered_df.copy()
-    timeline_df['dominant_category'] = timeline_df['category_scores'].apply(get_dominant_category_safe)
     fig_timeline = px.timeline(
-        timeline_df,
+        filtered_df,
         x_start='pub_date',
         x_end='pub_date',
         y='dominant_category',
@@ -149,21 +266,24 @@ def update_graphs(selected_categories, min_risk):
     fig_timeline.update_yaxes(categoryorder='total ascending')
 
     # Map
-    filtered_map_df['dominant_category'] = filtered_map_df['category_scores'].apply(get_dominant_category_safe)
-    fig_map = px.scatter_mapbox(
-        filtered_map_df,
-        lat='lat',
-        lon='lon',
-        color='dominant_category',
-        size='overall_risk_score',
-        hover_name='title',
-        hover_data=['summary','category_scores','locations'],
-        zoom=1,
-        mapbox_style="open-street-map",
-        title='Global Threat Map from News'
-    )
+    if geo_ready:
+        fig_map = px.scatter_mapbox(
+            query_map_articles(selected_categories, min_risk),
+            lat='lat',
+            lon='lon',
+            color='dominant_category',
+            size='overall_risk_score',
+            hover_name='title',
+            hover_data=['summary','category_scores','locations'],
+            zoom=1,
+            mapbox_style="open-street-map",
+            title='Global Threat Map from News'
+        )
+    else:
+        fig_map = go.Figure(layout={'title': 'Global Threat Map from News (loading locations...)'})
 
-    return fig_timeline, fig_map
+    # Cache plain dicts so hits skip Plotly's figure validation on the way out
+    return fig_timeline.to_plotly_json(), fig_map.to_plotly_json()
 
 # --------------------------
 # RUN DASH APP
@@ -1,17 +1,22 @@
 # main.py - Refactored AI News Dashboard Data Processing
 
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
+from io import BytesIO
 import pandas as pd
+import numpy as np
 import sqlite3
-import json
-import time
+import orjson
+import asyncio
 import spacy
 import openai
 from dotenv import load_dotenv
 import os
+import tempfile
 from geopy.geocoders import Nominatim
+from geopy.extra.rate_limiter import RateLimiter
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 
 # --------------------------
 # CONFIGURATION
@@ -42,21 +47,42 @@ RSS_FEEDS = [
 ]
 
 DB_PATH = "articles.db"
+GEOCODE_CACHE_PATH = "geocode_cache.json"
 MODEL_NAME = "gpt-3.5-turbo-instruct"
+MAX_CONCURRENT_REQUESTS = 5
+REQUESTS_PER_MINUTE = 60
+# Threat categories the AI is asked to score (see categorize_and_score)
+CATEGORIES = ("cyber", "military", "political", "space/satellite")
 
 nlp = spacy.load("en_core_web_sm")
+# One connection for the whole run; autocommit, with explicit transactions for writes
+DB = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
 geolocator = Nominatim(user_agent="osint_news_module")
-GEOCODE_CACHE = {}
+# Nominatim allows 1 request/second; the limiter is shared by all worker threads
+geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
 # --------------------------
 # LOAD GEOCODE CACHE
 # --------------------------
-import json
+def load_geocode_cache(path):
+    # A missing or half-written cache (shared with dashboard.py) just starts empty
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {}
+
+def save_geocode_cache(cache, path):
+    """Write to a temp file and swap it in, so readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(cache))
+        os.replace(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
 
-try:
-    with open("geocode_cache.json", "r") as f:
-        GEOCODE_CACHE = json.load(f)
-except FileNotFoundError:
-    GEOCODE_CACHE = {}
+GEOCODE_CACHE = load_geocode_cache(GEOCODE_CACHE_PATH)
 
 # --------------------------
 # UTILITY FUNCTIONS
@@ -65,17 +91,44 @@ def safe_load_json(x):
     if pd.isnull(x):
         return {}
     try:
-        return json.loads(x)
+        return orjson.loads(x)
     except:
         return {}
 
-def get_dominant_category_safe(cat_scores):
-    if not cat_scores or cat_scores == {}:
-        return 'Unknown'
+def category_score_matrix(cat_scores_list):
+    """Dense (N, len(CATEGORIES)) float32 matrix of per-category scores."""
+    scores = np.zeros((len(cat_scores_list), len(CATEGORIES)), dtype=np.float32)
+    for i, cat_scores in enumerate(cat_scores_list):
+        try:
+            cat_scores = {k.lower(): v for k, v in cat_scores.items()}
+            for j, cat in enumerate(CATEGORIES):
+                scores[i, j] = cat_scores.get(cat, 0)
+        except:
+            scores[i] = 0
+    return scores
+
+def get_dominant_categories(scores):
+    """Highest-scoring category per row, 'Unknown' where no score is positive."""
+    idx = np.argmax(scores, axis=1)
+    # Reuse the argmax to read each row's max instead of a second pass over scores
+    best = np.take_along_axis(scores, idx[:, None], axis=1)[:, 0]
+    return np.where(best > 0, np.array(CATEGORIES)[idx], 'Unknown').tolist()
+
+def parse_pub_date(pub_date):
+    """pubDate -> ISO-8601 string, so the dashboard can skip dateutil.
+    Feeds normally use RFC-822, but some already publish ISO-8601.
+    Returns None if neither format parses."""
+    if not pub_date:
+        return None
+    pub_date = pub_date.strip()
     try:
-        return max(cat_scores, key=cat_scores.get)
-    except:
-        return 'Unknown'
+        return parsedate_to_datetime(pub_date).isoformat()
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(pub_date.replace("Z", "+00:00")).isoformat()
+    except ValueError:
+        return None
 
 def geocode_location(location):
     if not location:
@@ -83,7 +136,7 @@ def geocode_location(location):
     if location in GEOCODE_CACHE:
         return GEOCODE_CACHE[location]
     try:
-        loc = geolocator.geocode(location, timeout=10)
+        loc = geocode(location, timeout=10)
         if loc:
             GEOCODE_CACHE[location] = (loc.latitude, loc.longitude)
             return loc.latitude, loc.longitude
@@ -95,39 +148,42 @@ def geocode_location(location):
 # --------------------------
 # GET EXISTING LINKS FROM DB
 # --------------------------
-def get_existing_links(db_path):
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute("SELECT link FROM articles")
-    links = set([row[0] for row in c.fetchall()])
-    conn.close()
-    return links
+def get_existing_links(conn):
+    return {row[0] for row in conn.execute("SELECT link FROM articles")}
 
 # --------------------------
 # STEP 1: SCRAPE NEWS
 # --------------------------
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# Shared session so connections are kept alive and reused across feeds
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "Mozilla/5.0"})
+
 def fetch_feed(url):
     try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, timeout=10, headers=headers)
+        response = SESSION.get(url, timeout=10)
         if response.status_code != 200:
             print(f"Failed to fetch {url}, status code: {response.status_code}")
             return []
-        soup = BeautifulSoup(response.content, "lxml-xml")
-        items = soup.find_all('item')
         articles = []
 
-        for item in items:
+        # Stream <item> elements instead of building a full parse tree;
+        # {*} also matches namespaced items such as RSS 1.0/RDF feeds
+        for _, item in etree.iterparse(BytesIO(response.content), tag="{*}item", recover=True):
+            title = item.findtext("{*}title")
+            link = item.findtext("{*}link")
+            pub_date = item.findtext("{*}pubDate")
             # Only include items that have both title and link
-            if item.title and item.link:
+            if title and link:
                 articles.append({
-                    "title": item.title.text,
-                    "link": item.link.text,
-                    "pub_date": getattr(item.pubDate, "text", ""),
-                    "description": getattr(item.description, "text", "")
+                    "title": title,
+                    "link": link,
+                    # Keep the raw text rather than lose a date we can't parse
+                    "pub_date": parse_pub_date(pub_date) or pub_date,
+                    "description": item.findtext("{*}description", "")
                 })
+            item.clear()
         return articles
     except Exception as e:
         print(f"Error fetching {url}: {e}")
@@ -153,12 +209,12 @@ def scrape_rss(feeds, max_per_feed=1):
 # --------------------------
 # STEP 2: AI SUMMARIZATION + THREAT DETECTION (Updated for OpenAI >=1.0.0)
 # --------------------------
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 # Initialize OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def categorize_and_score(article_text):
+async def categorize_and_score(article_text):
     """
     Uses OpenAI GPT-4 to summarize an article, assign category scores,
     and compute overall risk score. Returns a JSON dictionary with:
@@ -175,7 +231,7 @@ def categorize_and_score(article_text):
     Article: {article_text}
     """
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=MODEL_NAME,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.5
@@ -183,23 +239,60 @@ def categorize_and_score(article_text):
         # Extract content from response
         content = response.choices[0].message.content
         # Convert string to dictionary
-        return json.loads(content)
+        return orjson.loads(content)
     except Exception as e:
         print(f"AI analysis failed: {e}")
         # Fallback if AI fails
         return {"summary": article_text[:150]+"...", "categories": {}, "overall_risk_score": 0}
+
+async def analyze_articles(articles):
+    """Runs categorize_and_score concurrently, with at most
+    MAX_CONCURRENT_REQUESTS in flight and REQUESTS_PER_MINUTE overall.
+    Results are returned in the same order as articles."""
+    sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def analyze(i, article):
+        async with sem:
+            print(f"Processing article {i+1}/{len(articles)}: {article['title']}")
+            res = await categorize_and_score(article['description'])
+            # Hold the slot so all slots together stay under REQUESTS_PER_MINUTE
+            await asyncio.sleep(60 * MAX_CONCURRENT_REQUESTS / REQUESTS_PER_MINUTE)
+        return res
+
+    return await asyncio.gather(*(analyze(i, a) for i, a in enumerate(articles)))
 # --------------------------
 # STEP 3: LOCATION EXTRACTION
 # --------------------------
-def extract_locations(text):
-    doc = nlp(text)
-    return list({ent.text for ent in doc.ents if ent.label_ in ["GPE", "LOC"]})
+GEO_LABELS = frozenset(("GPE", "LOC"))
+
+def unique_locations(doc):
+    """Location entities in order of appearance, deduplicated so that
+    e.g. "USA", "usa" and "U.S.A." are only geocoded once."""
+    locations = {}
+    for ent in doc.ents:
+        if ent.label_ in GEO_LABELS:
+            text = ent.text.strip()
+            locations.setdefault(text.casefold().replace(".", ""), text)
+    return list(locations.values())
+
+def extract_locations(texts):
+    """Batched NER over texts; returns one list of locations per text."""
+    # Only the NER component is needed, so skip the rest of the pipeline
+    docs = nlp.pipe(texts, batch_size=32, disable=["tagger", "parser", "attribute_ruler", "lemmatizer"])
+    return [unique_locations(doc) for doc in docs]
+
+async def analyze_and_locate(articles):
+    """OpenAI analysis is network-bound and NER is CPU-bound, so NER runs in a
+    worker thread while the requests are in flight. Returns (results, locations)."""
+    return await asyncio.gather(
+        analyze_articles(articles),
+        asyncio.to_thread(extract_locations, [a['description'] for a in articles])
+    )
 
 # --------------------------
 # STEP 4: DATABASE OPERATIONS
 # --------------------------
-def setup_db(path):
-    conn = sqlite3.connect(path)
+def setup_db(conn):
     c = conn.cursor()
     c.execute('''
         CREATE TABLE IF NOT EXISTS articles (
@@ -217,82 +310,104 @@ def setup_db(path):
             overall_risk_score REAL
         )
     ''')
-    conn.commit()
-    conn.close()
-
-def save_articles_to_db(articles, path):
-    conn = sqlite3.connect(path)
-    c = conn.cursor()
-    for article in articles:
-        lat, lon = None, None
-        if article['locations']:
-            # Take first location for mapping purposes
-            lat, lon = geocode_location(article['locations'][0])
-        c.execute('''
+    # Serves the dashboard's per-callback category/risk filter
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cat_risk ON articles(dominant_category, overall_risk_score)")
+    # WAL is persistent on the database file; the rest apply to this connection
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA cache_size=-65536")
+    c.execute("PRAGMA temp_store=MEMORY")
+
+    # One-off migration: rows saved before pub_date was stored as ISO-8601
+    # still hold RFC-822 strings, which the dashboard would parse as NaT.
+    # Values that don't parse are left as they are
+    stale = [row[0] for row in c.execute(
+        "SELECT DISTINCT pub_date FROM articles WHERE pub_date NOT GLOB '[0-9][0-9][0-9][0-9]-*'"
+    )]
+    updates = [(iso, d) for iso, d in zip(map(parse_pub_date, stale), stale) if iso]
+    if updates:
+        c.execute("BEGIN")
+        try:
+            c.executemany("UPDATE articles SET pub_date = ? WHERE pub_date = ?", updates)
+        except:
+            c.execute("ROLLBACK")
+            raise
+        c.execute("COMMIT")
+
+def save_articles_to_db(articles, conn):
+    # Take first location for mapping purposes, geocoding each unique one once
+    first_locs = [a['locations'][0] if a['locations'] else None for a in articles]
+    unique_locs = list({loc for loc in first_locs if loc})
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        coords = dict(zip(unique_locs, executor.map(geocode_location, unique_locs)))
+    coords[None] = (None, None)
+
+    dominant = get_dominant_categories(category_score_matrix([a['category_scores'] for a in articles]))
+
+    rows = [(
+        a['title'],
+        a['link'],
+        a['pub_date'],
+        a['description'],
+        a['summary'],
+        orjson.dumps(a['category_scores']).decode(),
+        dominant_category,
+        orjson.dumps(a['locations']).decode(),
+        *coords[loc],
+        a['overall_risk_score']
+    ) for a, loc, dominant_category in zip(articles, first_locs, dominant)]
+
+    # Single transaction: commits on success, rolls back on error
+    conn.execute("BEGIN")
+    try:
+        conn.executemany('''
             INSERT OR REPLACE INTO articles
             (title, link, pub_date, description, summary, category_scores, dominant_category, locations, lat, lon, overall_risk_score)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            article['title'],
-            article['link'],
-            article['pub_date'],
-            article['description'],
-            article['summary'],
-            json.dumps(article['category_scores']),
-            get_dominant_category_safe(article['category_scores']),
-            json.dumps(article['locations']),
-            lat,
-            lon,
-            article['overall_risk_score']
-        ))
-    conn.commit()
-    conn.close()
+        ''', rows)
+    except:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
     print(f"Saved {len(articles)} articles to database.")
 
 # --------------------------
 # MAIN EXECUTION
 # --------------------------
 def main():
-    setup_db(DB_PATH)
+    setup_db(DB)
 
     # Load geocode cache at the start (already handled at top of file)
     global GEOCODE_CACHE
-    try:
-        with open("geocode_cache.json", "r") as f:
-            GEOCODE_CACHE = json.load(f)
-    except FileNotFoundError:
-        GEOCODE_CACHE = {}
+    GEOCODE_CACHE = load_geocode_cache(GEOCODE_CACHE_PATH)
 
     # Scrape articles from RSS feeds, limit 1 article per feed to avoid API overuse
     articles = scrape_rss(RSS_FEEDS, max_per_feed=1)
 
     # Get already processed links from the database
-    existing_links = get_existing_links(DB_PATH)
+    existing_links = get_existing_links(DB)
 
-    for i, article in enumerate(articles):
+    new_articles = []
+    for article in articles:
         if article['link'] in existing_links:
             print(f"Skipping already processed article: {article['title']}")
             continue
+        new_articles.append(article)
 
-        print(f"Processing article {i+1}/{len(articles)}: {article['title']}")
+    # AI summarization and threat detection, overlapped with location extraction
+    results, locations = asyncio.run(analyze_and_locate(new_articles))
 
-        # AI summarization and threat detection
-        res = categorize_and_score(article['description'])
+    for article, res, locs in zip(new_articles, results, locations):
         article['summary'] = res['summary']
         article['category_scores'] = res['categories']
         article['overall_risk_score'] = res['overall_risk_score']
-
-        # Extract locations
-        article['locations'] = extract_locations(article['description'])
-
-        time.sleep(1)  # optional delay to prevent API overload
+        article['locations'] = locs
 
     # Save all new articles to the database
-    save_articles_to_db(articles, DB_PATH)
+    save_articles_to_db(new_articles, DB)
 
     # Save geocode cache for future runs
-    with open("geocode_cache.json", "w") as f:
-        json.dump(GEOCODE_CACHE, f)
+    save_geocode_cache(GEOCODE_CACHE, GEOCODE_CACHE_PATH)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
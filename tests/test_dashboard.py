@@ -0,0 +1,64 @@
+import importlib
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import orjson
+import plotly.graph_objects as go
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+CALLBACK_BODY = {
+    "output": "..timeline-graph.figure...map-graph.figure..",
+    "outputs": [{"id": "timeline-graph", "property": "figure"},
+                {"id": "map-graph", "property": "figure"}],
+    "inputs": [{"id": "category-dropdown", "property": "value", "value": None},
+               {"id": "risk-slider", "property": "value", "value": 0}],
+    "changedPropIds": ["risk-slider.value"],
+}
+
+def load_dashboard(tmp_path, monkeypatch, rows):
+    """Import dashboard.py against a temp articles.db holding rows."""
+    conn = sqlite3.connect(tmp_path / "articles.db")
+    conn.execute('''
+        CREATE TABLE articles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, link TEXT UNIQUE, pub_date TEXT,
+            description TEXT, summary TEXT, category_scores TEXT, dominant_category TEXT,
+            locations TEXT, lat REAL, lon REAL, overall_risk_score REAL
+        )
+    ''')
+    conn.executemany('''
+        INSERT INTO articles (title, link, pub_date, summary, category_scores, dominant_category, locations, overall_risk_score)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+    # Every location is cached, so the dashboard never calls Nominatim
+    (tmp_path / "geocode_cache.json").write_bytes(orjson.dumps({"Kyiv": [50.45, 30.52]}))
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(REPO_ROOT))
+    sys.modules.pop("dashboard", None)
+    dashboard = importlib.import_module("dashboard")
+    for _ in range(50):
+        if dashboard.coord_maps is not None:
+            break
+        time.sleep(0.1)
+    assert dashboard.coord_maps is not None, "location lookups were never built"
+    return dashboard
+
+def test_callback_with_null_row(tmp_path, monkeypatch):
+    dashboard = load_dashboard(tmp_path, monkeypatch, [
+        ("t1", "l1", "2025-06-10T14:00:00+00:00", None, "{}", "cyber", '["Kyiv"]', 0.5),
+        ("t2", "l2", None, "s", None, None, "not json", None),
+    ])
+    client = dashboard.app.server.test_client()
+
+    assert client.get("/_dash-layout").status_code == 200
+    response = client.post("/_dash-update-component", json=CALLBACK_BODY)
+    assert response.status_code == 200
+    figures = orjson.loads(response.data)["response"]
+    fig_map = go.Figure(figures["map-graph"]["figure"])
+    assert list(fig_map.data[0].lat) == [50.45]
+    assert list(fig_map.data[0].lon) == [30.52]
@@ -0,0 +1,90 @@
+import importlib
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+import spacy
+from spacy.tokens import Doc, Span
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    """Import main.py with its articles.db and geocode cache under tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    # NER isn't exercised through the model here, so skip loading it
+    monkeypatch.setattr(spacy, "load", lambda name: spacy.blank("en"))
+    monkeypatch.syspath_prepend(str(REPO_ROOT))
+    sys.modules.pop("main", None)
+    module = importlib.import_module("main")
+    yield module
+    module.DB.close()
+
+def test_parse_pub_date(main):
+    assert main.parse_pub_date("Tue, 10 Jun 2025 14:00:00 GMT") == "2025-06-10T14:00:00+00:00"
+    assert main.parse_pub_date("2025-06-10T14:00:00Z") == "2025-06-10T14:00:00+00:00"
+    assert main.parse_pub_date("junk") is None
+    assert main.parse_pub_date("") is None
+    assert main.parse_pub_date(None) is None
+
+def test_setup_db_migrates_rfc822_pub_dates(main):
+    main.setup_db(main.DB)
+    main.DB.executemany("INSERT INTO articles (link, pub_date) VALUES (?, ?)", [
+        ("rfc822", "Tue, 10 Jun 2025 14:00:00 GMT"),
+        ("iso", "2025-06-10T14:00:00Z"),
+        ("junk", "junk"),
+        ("empty", ""),
+        ("null", None),
+    ])
+
+    main.setup_db(main.DB)
+
+    assert dict(main.DB.execute("SELECT link, pub_date FROM articles")) == {
+        "rfc822": "2025-06-10T14:00:00+00:00",
+        "iso": "2025-06-10T14:00:00Z",
+        # Unparseable values keep their original text
+        "junk": "junk",
+        "empty": "",
+        "null": None,
+    }
+
+def test_category_score_matrix(main):
+    scores = main.category_score_matrix([
+        {"Cyber": 0.9, "military": 0.2},
+        {},
+        None,  # failed AI response
+        {"space/satellite": 0.5, "economic": 1.0},
+    ])
+
+    assert scores.dtype == np.float32
+    np.testing.assert_allclose(scores, [
+        [0.9, 0.2, 0.0, 0.0],
+        [0.0, 0.0, 0.0, 0.0],
+        [0.0, 0.0, 0.0, 0.0],
+        [0.0, 0.0, 0.0, 0.5],
+    ])
+
+def test_get_dominant_categories(main):
+    scores = np.array([
+        [0.9, 0.2, 0.0, 0.0],
+        [0.0, 0.0, 0.0, 0.0],
+        [0.1, 0.3, 0.7, 0.2],
+        [0.0, 0.0, 0.0, 0.5],
+    ], dtype=np.float32)
+
+    assert main.get_dominant_categories(scores) == ["cyber", "Unknown", "political", "space/satellite"]
+
+def test_unique_locations(main):
+    doc = Doc(main.nlp.vocab, words=["USA", "U.S.A.", "usa", "Paris", "NATO", "Kyiv"])
+    doc.ents = [
+        Span(doc, 0, 1, label="GPE"),
+        Span(doc, 1, 2, label="GPE"),
+        Span(doc, 2, 3, label="LOC"),
+        Span(doc, 3, 4, label="GPE"),
+        Span(doc, 4, 5, label="ORG"),
+        Span(doc, 5, 6, label="LOC"),
+    ]
+
+    assert main.unique_locations(doc) == ["USA", "Paris", "Kyiv"]